@@ -1,4 +1,6 @@
 import collections
+import functools
+import importlib
 import os
 from pathlib import Path
 
@@ -28,6 +30,13 @@ def relative_to(path, root):
         return p
 
 
+@functools.lru_cache(maxsize=None)
+def import_object(path):
+    """Import an object given its dotted path, e.g. `package.module.name`."""
+    module, name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)
+
+
 class Config(dict):
     """To simplify access, the configuration allows fetching nested
     keys separated by a period `.`, e.g.:
@@ -76,6 +85,14 @@ class Config(dict):
         except KeyError:
             return default
 
+    def resolve_factory(self, key):
+        """Import and return the object named by the dotted path at `key`.
+
+        E.g., ``cfg.resolve_factory("app.factory")``.  Imports are cached,
+        so repeated lookups of the same path are cheap.
+        """
+        return import_object(self[key])
+
     def show(self):
         """Print configuration"""
         print()
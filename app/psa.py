@@ -5,6 +5,7 @@ https://github.com/python-social-auth
 """
 
 import base64
+import functools
 import json
 import re
 import time
@@ -17,13 +18,13 @@ from social_core.backends.google import GoogleOAuth2
 from social_core.exceptions import MissingBackend
 from social_core.strategy import BaseStrategy, BaseTemplateStrategy
 from social_core.utils import build_absolute_uri
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, String, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.schema import UniqueConstraint
-from sqlalchemy.types import PickleType, Text
+from sqlalchemy.types import PickleType, Text, TypeDecorator
 from tornado.template import Loader, Template
 
 from baselayer.app.models import Base, DBSession, User
@@ -123,12 +124,17 @@ class UserMixin:
         return self.access_token
 
     def set_extra_data(self, extra_data=None):
-        if extra_data and self.extra_data != extra_data:
-            if self.extra_data and not isinstance(self.extra_data, str):
-                self.extra_data.update(extra_data)
-            else:
-                self.extra_data = extra_data
-            return True
+        if not extra_data:
+            return
+        if self.extra_data and not isinstance(self.extra_data, str):
+            # Only the incoming keys matter: if they already match the
+            # stored values, there is nothing to update
+            if all(self.extra_data.get(k) == v for k, v in extra_data.items()):
+                return
+            self.extra_data.update(extra_data)
+        else:
+            self.extra_data = extra_data
+        return True
 
     @classmethod
     def clean_username(cls, value):
@@ -383,6 +389,18 @@ class JSONType(PickleType):
         super().__init__(*args, **kwargs)
 
 
+# String type that accepts non-string values (e.g., integer provider
+# uids) and stores their string representation
+class StringUID(TypeDecorator):
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        return str(value)
+
+
 class SQLAlchemyMixin:
     COMMIT_SESSION = True
 
@@ -397,7 +415,6 @@ class SQLAlchemyMixin:
         session.add(instance)
         if cls.COMMIT_SESSION:
             session.commit()
-            session.flush()
         else:
             try:
                 session.flush()
@@ -426,7 +443,7 @@ class SQLAlchemyUserMixin(SQLAlchemyMixin, UserMixin):
 
     @declared_attr
     def extra_data(cls):
-        return Column(MutableDict.as_mutable(JSONType))
+        return Column(JSONType)
 
     @classmethod
     def changed(cls, user):
@@ -434,6 +451,9 @@ class SQLAlchemyUserMixin(SQLAlchemyMixin, UserMixin):
 
     def set_extra_data(self, extra_data=None):
         if super().set_extra_data(extra_data):
+            # `extra_data` may have been updated in place, which is not
+            # tracked on a plain JSON column
+            flag_modified(self, "extra_data")
             self._save_instance(self)
 
     @classmethod
@@ -479,18 +499,21 @@ class SQLAlchemyUserMixin(SQLAlchemyMixin, UserMixin):
 
     @classmethod
     def get_user(cls, pk):
-        return DBSession().query(cls.user_model()).filter_by(id=pk).first()
+        return DBSession().get(cls.user_model(), pk)
 
     @classmethod
     def get_users_by_email(cls, email):
-        return DBSession().query(cls.user_model()).filter_by(email=email).all()
+        User = cls.user_model()
+        return DBSession().scalars(select(User).where(User.email == email)).all()
 
     @classmethod
     def get_social_auth(cls, provider, uid):
-        if not isinstance(uid, str):
-            uid = str(uid)
         try:
-            return DBSession().query(cls).filter_by(provider=provider, uid=uid).first()
+            return (
+                DBSession()
+                .scalars(select(cls).where(cls.provider == provider, cls.uid == uid))
+                .first()
+            )
         except IndexError:
             return None
 
@@ -505,8 +528,6 @@ class SQLAlchemyUserMixin(SQLAlchemyMixin, UserMixin):
 
     @classmethod
     def create_social_auth(cls, user, uid, provider):
-        if not isinstance(uid, str):
-            uid = str(uid)
         return cls._new_instance(cls, user=user, uid=uid, provider=provider)
 
 
@@ -579,20 +600,26 @@ class SQLAlchemyCodeMixin(SQLAlchemyMixin, CodeMixin):
 
     @classmethod
     def get_code(cls, code):
-        return DBSession().query(cls).filter_by(code=code).first()
+        return DBSession().scalars(select(cls).where(cls.code == code)).first()
 
 
 class SQLAlchemyPartialMixin(SQLAlchemyMixin, PartialMixin):
     __tablename__ = "social_auth_partial"
     id = Column(Integer, primary_key=True)
     token = Column(String(32), index=True)
-    data = Column(MutableDict.as_mutable(JSONType))
+    data = Column(JSONType)
     next_step = Column(Integer)
     backend = Column(String(32))
 
+    def save(self):
+        # `args` / `kwargs` modify `data` in place, which is not tracked
+        # on a plain JSON column
+        flag_modified(self, "data")
+        super().save()
+
     @classmethod
     def load(cls, token):
-        return DBSession().query(cls).filter_by(token=token).first()
+        return DBSession().scalars(select(cls).where(cls.token == token)).first()
 
     @classmethod
     def destroy(cls, token):
@@ -615,22 +642,44 @@ class TornadoStorage:
         return exception.__class__ is IntegrityError
 
 
+@functools.lru_cache(maxsize=128)
+def _get_loader(path):
+    # `Loader` memoizes compiled templates internally, so reusing it
+    # avoids re-reading and re-parsing the template on every render
+    return Loader(path)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_template(html):
+    return Template(html)
+
+
 class TornadoTemplateStrategy(BaseTemplateStrategy):
     def render_template(self, tpl, context):
         path, tpl = tpl.rsplit("/", 1)
-        return Loader(path).load(tpl).generate(**context)
+        return _get_loader(path).load(tpl).generate(**context)
 
     def render_string(self, html, context):
-        return Template(html).generate(**context)
+        return _compile_template(html).generate(**context)
 
 
 class TornadoStrategy(BaseStrategy):
     DEFAULT_TEMPLATE_STRATEGY = TornadoTemplateStrategy
+    _default_tpl = None
 
     def __init__(self, storage, request_handler, tpl=None):
         self.request_handler = request_handler
         self.request = self.request_handler.request
-        super().__init__(storage, tpl)
+        super().__init__(storage, tpl or self._shared_template_strategy)
+
+    @classmethod
+    def _shared_template_strategy(cls, strategy):
+        # The template strategy renders from module-level caches and
+        # never refers back to its strategy, so one instance is shared
+        # by all request handlers
+        if cls._default_tpl is None:
+            cls._default_tpl = cls.DEFAULT_TEMPLATE_STRATEGY(None)
+        return cls._default_tpl
 
     def get_setting(self, name):
         return self.request_handler.settings[name]
@@ -684,7 +733,7 @@ def init_social():
     class UserSocialAuth(Base, SQLAlchemyUserMixin):
         """Social Auth association model"""
 
-        uid = Column(String(255))
+        uid = Column(StringUID(255))
         user_id = Column(User.id.type, ForeignKey(User.id), nullable=False, index=True)
         user = relationship(User, backref=backref("social_auth", lazy="dynamic"))
 
@@ -725,6 +774,8 @@ def init_social():
 
 
 class FakeGoogleOAuth2(GoogleOAuth2):
+    _access_token_url = None
+
     @property
     def AUTHORIZATION_URL(self):
         return self.strategy.absolute_uri("/fakeoauth2/auth")
@@ -748,8 +799,15 @@ class FakeGoogleOAuth2(GoogleOAuth2):
         #
         # Instead, we always connect to localhost:63000.
 
-        env, cfg = load_env()
-        return f'http://localhost:{cfg["ports.fake_oauth"]}/fakeoauth2/token'
+        #
+        # The URL depends only on configuration, so resolve it once
+        # per process.
+        if FakeGoogleOAuth2._access_token_url is None:
+            env, cfg = load_env()
+            FakeGoogleOAuth2._access_token_url = (
+                f'http://localhost:{cfg["ports.fake_oauth"]}/fakeoauth2/token'
+            )
+        return FakeGoogleOAuth2._access_token_url
 
     def user_data(self, access_token, *args, **kwargs):
         return {"id": "testuser@cesium-ml.org", "email": "testuser@cesium-ml.org"}
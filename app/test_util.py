@@ -1,13 +1,19 @@
+import contextlib
+import functools
+import json
 import os
+import shutil
+import subprocess
+import tempfile
 
 import pytest
 from selenium import webdriver
 from selenium.common.exceptions import (
     ElementClickInterceptedException,
     JavascriptException,
-    NoSuchElementException,
     StaleElementReferenceException,
     TimeoutException,
+    WebDriverException,
 )
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
@@ -18,7 +24,263 @@ from seleniumrequests.request import RequestsSessionMixin
 from baselayer.app import models
 from baselayer.app.config import load_config
 
-cfg = load_config()
+
+@functools.lru_cache(maxsize=None)
+def _load_config():
+    return load_config()
+
+
+def __getattr__(name):
+    # `cfg` is loaded on first use, rather than when this module is
+    # imported (e.g., during test collection)
+    if name == "cfg":
+        return _load_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Initialized Firefox profiles, one per Firefox version
+FIREFOX_PROFILE_TEMPLATES = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "baselayer-firefox-profiles",
+)
+
+# Environment variable naming the file where test browsers of one test
+# run share their login cookies; set by `tools/test_frontend.py`
+COOKIES_FILE_ENV = "BASELAYER_TEST_COOKIES_FILE"
+
+WEBSOCKET_READY_SCRIPT = """
+    const status = document.getElementById('websocketStatus');
+    return !status || (status.title || '').indexOf('connected') >= 0;
+"""
+
+
+# Expected conditions only close over their locator, so one instance
+# per unique selector can be shared across waits
+@functools.lru_cache(maxsize=512)
+def _presence_of(by, selector):
+    return expected_conditions.presence_of_element_located((by, selector))
+
+
+@functools.lru_cache(maxsize=512)
+def _visibility_of(by, selector):
+    return expected_conditions.visibility_of_element_located((by, selector))
+
+
+@functools.lru_cache(maxsize=512)
+def _invisibility_of(by, selector):
+    return expected_conditions.invisibility_of_element((by, selector))
+
+
+@functools.lru_cache(maxsize=512)
+def _clickable(by, selector):
+    return expected_conditions.element_to_be_clickable((by, selector))
+
+
+BATCH_QUERY_CSS_SCRIPT = """
+    return Array.from(document.querySelectorAll(arguments[0])).map((e) => {
+        const rect = e.getBoundingClientRect();
+        return {
+            text: e.innerText,
+            visible: !!(e.offsetWidth || e.offsetHeight || e.getClientRects().length),
+            rect: {x: rect.x, y: rect.y, width: rect.width, height: rect.height},
+        };
+    });
+"""
+
+
+# Resolves to "logged_in", the login link element, or null on timeout
+LOGIN_STATE_SCRIPT = """
+    const [username, timeout, done] = arguments;
+    const start = Date.now();
+    (function poll() {
+        if (document.documentElement.textContent.includes(username)) {
+            return done("logged_in");
+        }
+        const link = document.querySelector("a[href*='/login/google-oauth2']");
+        if (link) {
+            return done(link);
+        }
+        if (Date.now() - start > timeout) {
+            return done(null);
+        }
+        setTimeout(poll, 50);
+    })();
+"""
+
+
+def nested_xpath(parent_xpath, child_xpath):
+    """Combine a parent and a child XPath into a single selector.
+
+    The child is resolved relative to the first element matching the
+    parent, as with ``find_element(parent).find_element(child)``, but
+    needs only one lookup in the browser.
+    """
+    if child_xpath.startswith("./"):
+        child_xpath = child_xpath[1:]
+    elif not child_xpath.startswith("/"):
+        child_xpath = "/" + child_xpath
+    return f"({parent_xpath})[1]{child_xpath}"
+
+
+@functools.lru_cache(maxsize=None)
+def geckodriver_path():
+    """Locate geckodriver on the PATH, or else download it; once per process."""
+    executable_path = shutil.which("geckodriver")
+    if executable_path is None:
+        from webdriver_manager.firefox import GeckoDriverManager
+
+        executable_path = GeckoDriverManager().install()
+    return executable_path
+
+
+def downloads_folder():
+    """Directory where the test browser saves downloaded files.
+
+    This is `paths.downloads_folder` from the config, except under
+    pytest-xdist, where each worker's browser gets its own subdirectory
+    so that parallel downloads do not collide.  Tests that inspect
+    downloads should look for them here.
+    """
+    folder = os.path.abspath(_load_config()["paths.downloads_folder"])
+    if "PYTEST_XDIST_WORKER" in os.environ:
+        folder = os.path.join(folder, os.environ["PYTEST_XDIST_WORKER"])
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+@functools.lru_cache(maxsize=None)
+def firefox_version():
+    """Version of the Firefox on the PATH, or None if it cannot be run."""
+    executable = shutil.which("firefox")
+    if executable is None:
+        return None
+    try:
+        output = subprocess.check_output(
+            [executable, "--version"], stderr=subprocess.DEVNULL, text=True
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    # E.g., "Mozilla Firefox 128.0.3"
+    return output.split()[-1] if output.strip() else None
+
+
+def firefox_profile_template():
+    """Path of the profile template for the installed Firefox, or None.
+
+    Profiles are tied to the version of Firefox that created them, so a
+    new template is made whenever Firefox is upgraded.
+    """
+    version = firefox_version()
+    if version is None:
+        return None
+    return os.path.join(FIREFOX_PROFILE_TEMPLATES, version)
+
+
+def firefox_profile():
+    """Create a Firefox profile for a test session.
+
+    The profile is a copy of the template for the installed Firefox, if
+    available, so that Firefox can skip its first-run initialization.
+
+    Returns
+    -------
+    str
+        Path to a temporary profile directory; the caller removes it.
+    """
+    profile = tempfile.mkdtemp(prefix="baselayer-firefox-")
+    template = firefox_profile_template()
+    if template is not None and os.path.isdir(template):
+        shutil.copytree(template, profile, dirs_exist_ok=True)
+    return profile
+
+
+def save_firefox_profile_template(profile):
+    """Keep an initialized profile as the template for later sessions."""
+    template = firefox_profile_template()
+    if template is None or os.path.isdir(template):
+        return
+
+    os.makedirs(FIREFOX_PROFILE_TEMPLATES, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=FIREFOX_PROFILE_TEMPLATES)
+    shutil.copytree(
+        profile,
+        staging,
+        # Leave out per-session state: geckodriver rewrites `user.js`, and
+        # preferences, cookies and site storage would otherwise carry
+        # over from the session that created the template
+        ignore=shutil.ignore_patterns(
+            "lock",
+            ".parentlock",
+            "parent.lock",
+            "user.js",
+            "prefs.js",
+            "cookies.sqlite*",
+            "webappsstore.sqlite*",
+            "storage",
+            "cache2",
+            "sessionstore*",
+        ),
+        dirs_exist_ok=True,
+    )
+    try:
+        # Atomic, so that parallel test workers never see a partial template
+        os.rename(staging, template)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+
+    # Templates of earlier Firefox versions are no longer used
+    for entry in os.listdir(FIREFOX_PROFILE_TEMPLATES):
+        path = os.path.join(FIREFOX_PROFILE_TEMPLATES, entry)
+        if path != template and not entry.startswith(".staging-"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def save_cookies(driver):
+    """Save the browser's cookies, e.g. after logging in.
+
+    Cookies are only shared within a test run, since user ids change when
+    the test database is cleared; nothing is saved outside of one.
+    """
+    cookies_file = os.environ.get(COOKIES_FILE_ENV)
+    if not cookies_file:
+        return
+
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cookies_file))
+    with os.fdopen(fd, "w") as f:
+        json.dump(driver.get_cookies(), f)
+    # Atomic, since parallel test workers may read the file at any time
+    os.replace(tmp_file, cookies_file)
+
+
+def load_cookies(driver):
+    """Add cookies saved earlier in this test run to the browser.
+
+    The browser must already be on the server's domain.
+
+    Returns
+    -------
+    bool
+        Whether any cookies were added.
+    """
+    cookies_file = os.environ.get(COOKIES_FILE_ENV)
+    if not cookies_file:
+        return False
+
+    try:
+        with open(cookies_file) as f:
+            cookies = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    try:
+        for cookie in cookies:
+            driver.add_cookie(cookie)
+    except WebDriverException:
+        # E.g., a cookie for another domain; log in as usual instead
+        driver.delete_all_cookies()
+        return False
+    return bool(cookies)
 
 
 def set_server_url(server_url):
@@ -27,6 +289,8 @@ def set_server_url(server_url):
 
 
 class MyCustomWebDriver(RequestsSessionMixin, webdriver.Firefox):
+    _implicit_wait = 0
+
     @property
     def server_url(self):
         if not hasattr(self, "_server_url"):
@@ -39,60 +303,68 @@ class MyCustomWebDriver(RequestsSessionMixin, webdriver.Firefox):
     def server_url(self, value):
         self._server_url = value
 
-    def get(self, uri):
-        webdriver.Firefox.get(self, self.server_url + uri)
+    def implicitly_wait(self, time_to_wait):
+        webdriver.Firefox.implicitly_wait(self, time_to_wait)
+        self._implicit_wait = time_to_wait
+
+    @contextlib.contextmanager
+    def no_implicit_wait(self):
+        """Disable the implicit wait for the duration of an explicit wait.
+
+        Otherwise, every poll that misses an element blocks for the full
+        implicit timeout.  This is a no-op unless an implicit wait was set.
+        """
+        implicit_wait = self._implicit_wait
+        if implicit_wait:
+            self.implicitly_wait(0)
         try:
-            self.find_element(By.ID, "websocketStatus")
-            self.wait_for_xpath(
-                "//*[@id='websocketStatus' and contains(@title,'connected')]"
-            )
-        except NoSuchElementException:
-            pass
+            yield
+        finally:
+            if implicit_wait:
+                self.implicitly_wait(implicit_wait)
 
-    def wait_for_xpath(self, xpath, timeout=10):
-        return WebDriverWait(self, timeout).until(
-            expected_conditions.presence_of_element_located((By.XPATH, xpath))
+    def wait_until(self, condition, timeout=10, **kwargs):
+        with self.no_implicit_wait():
+            return WebDriverWait(self, timeout, **kwargs).until(condition)
+
+    def wait_until_not(self, condition, timeout=10, **kwargs):
+        with self.no_implicit_wait():
+            return WebDriverWait(self, timeout, **kwargs).until_not(condition)
+
+    def get(self, uri, timeout=10):
+        webdriver.Firefox.get(self, self.server_url + uri)
+        # Wait for the websocket to connect, if the page has one; a
+        # single script per poll avoids separate find/wait round-trips
+        self.wait_until(
+            lambda driver: driver.execute_script(WEBSOCKET_READY_SCRIPT), timeout
         )
 
+    def wait_for_xpath(self, xpath, timeout=10):
+        return self.wait_until(_presence_of(By.XPATH, xpath), timeout)
+
     def wait_for_css(self, css, timeout=10):
-        return WebDriverWait(self, timeout).until(
-            expected_conditions.presence_of_element_located((By.CSS_SELECTOR, css))
-        )
+        return self.wait_until(_presence_of(By.CSS_SELECTOR, css), timeout)
 
     def wait_for_xpath_to_appear(self, xpath, timeout=10):
-        return WebDriverWait(self, timeout).until_not(
-            expected_conditions.invisibility_of_element((By.XPATH, xpath))
-        )
+        return self.wait_until(_visibility_of(By.XPATH, xpath), timeout)
 
     def wait_for_xpath_to_disappear(self, xpath, timeout=10):
-        return WebDriverWait(self, timeout).until(
-            expected_conditions.invisibility_of_element((By.XPATH, xpath))
-        )
+        return self.wait_until(_invisibility_of(By.XPATH, xpath), timeout)
 
     def wait_for_css_to_disappear(self, css, timeout=10):
-        return WebDriverWait(self, timeout).until(
-            expected_conditions.invisibility_of_element((By.CSS_SELECTOR, css))
-        )
+        return self.wait_until(_invisibility_of(By.CSS_SELECTOR, css), timeout)
 
     def wait_for_xpath_to_be_clickable(self, xpath, timeout=10):
-        return WebDriverWait(self, timeout).until(
-            expected_conditions.element_to_be_clickable((By.XPATH, xpath))
-        )
+        return self.wait_until(_clickable(By.XPATH, xpath), timeout)
 
     def wait_for_xpath_to_be_unclickable(self, xpath, timeout=10):
-        return WebDriverWait(self, timeout).until_not(
-            expected_conditions.element_to_be_clickable((By.XPATH, xpath))
-        )
+        return self.wait_until_not(_clickable(By.XPATH, xpath), timeout)
 
     def wait_for_css_to_be_clickable(self, css, timeout=10):
-        return WebDriverWait(self, timeout).until(
-            expected_conditions.element_to_be_clickable((By.CSS_SELECTOR, css))
-        )
+        return self.wait_until(_clickable(By.CSS_SELECTOR, css), timeout)
 
     def wait_for_css_to_be_unclickable(self, css, timeout=10):
-        return WebDriverWait(self, timeout).until_not(
-            expected_conditions.element_to_be_clickable((By.CSS_SELECTOR, css))
-        )
+        return self.wait_until_not(_clickable(By.CSS_SELECTOR, css), timeout)
 
     def scroll_to_element(self, element, scroll_parent=False):
         scroll_script = (
@@ -137,6 +409,26 @@ class MyCustomWebDriver(RequestsSessionMixin, webdriver.Firefox):
             element = self.wait_for_xpath(xpath)
         return self.scroll_to_element_and_click(element, scroll_parent=scroll_parent)
 
+    def wait_for_nested_xpath(self, parent_xpath, child_xpath, timeout=10):
+        return self.wait_for_xpath(nested_xpath(parent_xpath, child_xpath), timeout)
+
+    def click_nested_xpath(self, parent_xpath, child_xpath, **kwargs):
+        return self.click_xpath(nested_xpath(parent_xpath, child_xpath), **kwargs)
+
+    def batch_query_css(self, css):
+        """Return text, visibility, and position of all elements matching `css`.
+
+        Equivalent to inspecting each of ``find_elements(By.CSS_SELECTOR, css)``
+        in turn, but done in a single WebDriver call.
+
+        Returns
+        -------
+        list of dict
+            One ``{"text", "visible", "rect"}`` entry per element, in
+            document order.
+        """
+        return self.execute_script(BATCH_QUERY_CSS_SCRIPT, css)
+
     def click_css(self, css, timeout=10, scroll_parent=False):
         element = self.wait_for_css_to_be_clickable(css, timeout=timeout)
         return self.scroll_to_element_and_click(element, scroll_parent=scroll_parent)
@@ -144,20 +436,20 @@ class MyCustomWebDriver(RequestsSessionMixin, webdriver.Firefox):
 
 @pytest.fixture(scope="session")
 def driver(request):
-    import shutil
-
     from selenium import webdriver
-    from webdriver_manager.firefox import GeckoDriverManager
 
     options = webdriver.FirefoxOptions()
+    profile = firefox_profile()
+    options.add_argument("-profile")
+    options.add_argument(profile)
     if "BASELAYER_TEST_HEADLESS" in os.environ:
-        options.headless = True
+        options.add_argument("-headless")
+    if "BASELAYER_TEST_DISABLE_IMAGES" in os.environ:
+        options.set_preference("permissions.default.image", 2)
     options.set_preference("devtools.console.stdout.content", True)
     options.set_preference("browser.download.manager.showWhenStarting", False)
     options.set_preference("browser.download.folderList", 2)
-    options.set_preference(
-        "browser.download.dir", os.path.abspath(cfg["paths.downloads_folder"])
-    )
+    options.set_preference("browser.download.dir", downloads_folder())
     options.set_preference(
         "browser.helperApps.neverAsk.saveToDisk",
         (
@@ -166,43 +458,52 @@ def driver(request):
         ),
     )
 
-    executable_path = shutil.which("geckodriver")
-    if executable_path is None:
-        executable_path = GeckoDriverManager().install()
-    service = webdriver.firefox.service.Service(executable_path=executable_path)
+    service = webdriver.firefox.service.Service(executable_path=geckodriver_path())
 
     driver = MyCustomWebDriver(options=options, service=service)
+    # Element lookups are synchronized with explicit waits only
+    driver.implicitly_wait(0)
     driver.set_window_size(1920, 1200)
     login(driver)
 
     yield driver
 
-    driver.close()
+    driver.quit()
+    save_firefox_profile_template(profile)
+    shutil.rmtree(profile, ignore_errors=True)
 
 
 def login(driver):
-    username_xpath = '//*[contains(string(),"testuser-cesium-ml-org")]'
+    username = "testuser-cesium-ml-org"
+    username_xpath = f'//*[contains(string(),"{username}")]'
 
-    driver.get("/")
-    try:
-        driver.wait_for_xpath(username_xpath, 0.25)
-        return  # Already logged in
-    except TimeoutException:
-        pass
+    # An authenticated session carries the `user_id` cookie; no need to
+    # load a page to find out we are already logged in
+    if any(cookie["name"] == "user_id" for cookie in driver.get_cookies()):
+        return
 
-    try:
-        element = driver.wait_for_xpath(
-            '//a[contains(@href,"/login/google-oauth2")]', 20
-        )
-        element.click()
-    except TimeoutException:
-        pass
+    driver.get("/")
+    # Try the session of an earlier test browser; if it is no longer
+    # valid (e.g., the test database was cleared), we log in as usual
+    if load_cookies(driver):
+        driver.refresh()
 
     try:
+        # Poll in the page, rather than over WebDriver, until either the
+        # username or the login link shows up
+        state = driver.execute_async_script(LOGIN_STATE_SCRIPT, username, 20000)
+        if state is None:
+            raise TimeoutException()
+        if state == "logged_in":
+            return
+
+        state.click()  # login link
         driver.wait_for_xpath(username_xpath, 5)
     except TimeoutException:
         raise TimeoutException("Login failed:\n" + driver.page_source)
 
+    save_cookies(driver)
+
 
 @pytest.fixture(scope="function", autouse=True)
 def reset_state(request):
@@ -1,3 +1,4 @@
+import functools
 import zlib
 from datetime import datetime
 
@@ -49,7 +50,13 @@ def colorize(s, fg=None, bg=None, bold=False, underline=False, reverse=False):
     -------
     A string with embedded color escape sequences.
     """
+    return _style_start(fg, bg, bold, underline, reverse) + s + "\x1b[0m"
 
+
+# The escape sequence depends only on the style, of which there are few
+# distinct combinations in practice
+@functools.lru_cache(maxsize=128)
+def _style_start(fg, bg, bold, underline, reverse):
     style_fragments = []
     if fg in COLOR_TABLE:
         # Foreground colors go from 30-39
@@ -63,17 +70,27 @@ def colorize(s, fg=None, bg=None, bold=False, underline=False, reverse=False):
         style_fragments.append(4)
     if reverse:
         style_fragments.append(7)
-    style_start = "\x1b[" + ";".join(map(str, style_fragments)) + "m"
-    style_end = "\x1b[0m"
-    return style_start + s + style_end
+    return "\x1b[" + ";".join(map(str, style_fragments)) + "m"
 
 
-def log(app, message):
+@functools.lru_cache(maxsize=None)
+def app_color(app):
+    """Pick a color for an app's log lines, consistently across runs."""
     color_table = ["red", "green", "yellow", "blue", "magenta", "cyan", "white"]
-    color = color_table[zlib.crc32(app.encode("ascii")) % len(color_table)]
+    return color_table[zlib.crc32(app.encode("ascii")) % len(color_table)]
+
+
+def log(app, message):
+    color = app_color(app)
     timestamp = datetime.now().strftime("%H:%M:%S")
-    formatted_message = f"[{timestamp} {app}] {message}"
-    print(colorize(formatted_message, fg=color, bold=True))
+    # Multi-line messages are printed at once, with every line prefixed
+    lines = str(message).splitlines() or [""]
+    print(
+        "\n".join(
+            colorize(f"[{timestamp} {app}] {line}", fg=color, bold=True)
+            for line in lines
+        )
+    )
 
 
 def make_log(app):
@@ -1,4 +1,3 @@
-import importlib
 import time
 
 import requests
@@ -25,15 +24,14 @@ log = make_log(f"app_{env.process or 0}")
 from baselayer.app.app_server import handlers as baselayer_handlers  # noqa: E402
 from baselayer.app.app_server import settings as baselayer_settings  # noqa: E402
 
-app_factory = cfg["app.factory"]
 baselayer_settings["cookie_secret"] = cfg["app.secret_key"]
 baselayer_settings["autoreload"] = env.debug
 
 
-def migrated_db(migration_manager_port):
+def migrated_db(migration_manager_port, session=requests):
     port = migration_manager_port
     try:
-        r = requests.get(f"http://localhost:{port}")
+        r = session.get(f"http://localhost:{port}", timeout=10)
         status = r.json()
     except requests.exceptions.RequestException:
         log(f"Could not connect to migration manager on port [{port}]")
@@ -46,14 +44,16 @@ def migrated_db(migration_manager_port):
 log("Verifying database migration status")
 port = cfg["ports.migration_manager"]
 timeout = 1
-while not migrated_db(port):
+# Keep the connection to the migration manager open between polls
+migration_session = requests.Session()
+while not migrated_db(port, session=migration_session):
     log(f"Database not migrated, or could not verify; trying again in {timeout}s")
     time.sleep(timeout)
     timeout = min(timeout * 2, 30)
+migration_session.close()
 
 
-module, app_factory = app_factory.rsplit(".", 1)
-app_factory = getattr(importlib.import_module(module), app_factory)
+app_factory = cfg.resolve_factory("app.factory")
 
 app = app_factory(
     cfg,
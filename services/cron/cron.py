@@ -1,6 +1,9 @@
+import heapq
+import json
 import os
 import subprocess
 import sys
+import tempfile
 import time
 from datetime import datetime
 
@@ -18,18 +21,32 @@ jobs = cfg.get("cron") or []
 
 init_db(**cfg["database"])
 
-timestamp_file = ".jobs_timestamps.yaml"
+timestamp_file = ".jobs_timestamps.json"
+# Written by earlier versions of this service
+legacy_timestamp_file = ".jobs_timestamps.yaml"
+
+
+def within_limit(limit):
+    """Whether the current time of day is inside `limit`, if given."""
+    if limit is None:
+        return True
+    limit_start, limit_end = limit
+    return limit_start < datetime.now().time() < limit_end
 
 
 class TimeCache:
     def __init__(self):
         if os.path.exists(timestamp_file):
             with open(timestamp_file) as f:
+                timestamps = json.load(f)["timestamps"]
+        elif os.path.exists(legacy_timestamp_file):
+            with open(legacy_timestamp_file) as f:
                 timestamps = yaml.full_load(f)["timestamps"]
         else:
             timestamps = {}
 
         self.ts = timestamps
+        self.dirty = False
 
     def should_run(self, key, interval, limit=None):
         """Determine whether job should run.
@@ -40,66 +57,143 @@ class TimeCache:
             A key for the job, made up of `script_name+interval`.
         interval : int
             Interval, in minutes, at which to execute the job.
-        limit : tuple of two time strings, optional
+        limit : tuple of two `datetime.time`, optional
             Limit the execution of the job to this bracket.
 
         """
-        if limit is not None:
-            limit_start, limit_end = (parse_time(t) for t in limit)
-            now = datetime.now()
-            if not (limit_start < now < limit_end):
-                return False
+        if not within_limit(limit):
+            return False
 
         if key not in self.ts:
             self.reset(key)
 
-        return (time.time() - self.ts[key]) > interval * 60
+        return (time.time() - self.ts[key]) >= interval * 60
 
     def reset(self, key):
         self.ts[key] = time.time()
-        self.cache_to_file()
+        self.dirty = True
 
     def cache_to_file(self):
+        """Write timestamps to disk, if they changed since the last write."""
+        if not self.dirty:
+            return
         with open(timestamp_file, "w") as f:
-            yaml.dump({"timestamps": self.ts}, f)
+            json.dump({"timestamps": self.ts}, f)
+        self.dirty = False
 
 
+# Limits are times of day, so they only need to be parsed once
+for job in jobs:
+    if job.get("limit") is not None:
+        job["limit"] = tuple(parse_time(t).time() for t in job["limit"])
+
 log(f"Monitoring {len(jobs)} jobs")
 
+
+class JobRun:
+    """A launched cron job.
+
+    The job writes its output to a temporary file rather than a pipe, so
+    it never blocks on a full pipe, and output need not be held in memory
+    while the job runs.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self._output_file = tempfile.TemporaryFile()
+        try:
+            self.proc = subprocess.Popen(
+                [script, *sys.argv[1:]],
+                stdout=self._output_file,
+                stderr=subprocess.STDOUT,
+            )
+        except Exception:
+            self._output_file.close()
+            raise
+
+    def done(self):
+        return self.proc.poll() is not None
+
+    def output(self):
+        with self._output_file as f:
+            f.seek(0)
+            return f.read().decode("utf-8", errors="replace").strip()
+
+
+def reap(running):
+    """Record finished jobs, and return those still running."""
+    still_running = []
+    for job_run in running:
+        if not job_run.done():
+            still_running.append(job_run)
+            continue
+
+        DBSession().add(
+            CronJobRun(
+                script=job_run.script,
+                exit_status=job_run.proc.returncode,
+                output=job_run.output(),
+            )
+        )
+        DBSession().commit()
+
+    return still_running
+
+
 tc = TimeCache()
+running = []
+
+# Min-heap of `(next run time, job index)`, so that the scheduler can
+# sleep until the next job is due
+schedule = []
+for i, job in enumerate(jobs):
+    if job.get("interval") is None:
+        continue
+    key = f"{job['script']}+{job['interval']}"
+    if key not in tc.ts:
+        tc.reset(key)
+    heapq.heappush(schedule, (tc.ts[key] + job["interval"] * 60, i))
 
 while True:
-    for job in jobs:
-        if job.get("interval") is None:
-            continue
+    while schedule and schedule[0][0] <= time.time():
+        _, i = schedule[0]
+        job = jobs[i]
         interval = job["interval"]
         script = job["script"]
         limit = job.get("limit")
 
         key = f"{script}+{interval}"
 
-        if tc.should_run(key, interval, limit=limit):
-            log(f"Executing {script}")
+        # The heap already says the job is due; checking that again with
+        # `should_run` could disagree due to rounding
+        if within_limit(limit):
             tc.reset(key)
-            try:
-                proc = subprocess.Popen(
-                    [script, *sys.argv[1:]],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                output, _ = proc.communicate()
-            except Exception as e:
-                log(f"Error executing {script}: {e}")
-                DBSession().add(CronJobRun(script=script, exit_status=1, output=str(e)))
+            running = reap(running)
+            if any(job_run.script == script for job_run in running):
+                # Jobs are not written to run concurrently with themselves
+                log(f"Skipping {script}: previous run has not finished")
             else:
-                DBSession().add(
-                    CronJobRun(
-                        script=script,
-                        exit_status=proc.returncode,
-                        output=output.decode("utf-8").strip(),
+                log(f"Executing {script}")
+                try:
+                    running.append(JobRun(script))
+                except Exception as e:
+                    log(f"Error executing {script}: {e}")
+                    DBSession().add(
+                        CronJobRun(script=script, exit_status=1, output=str(e))
                     )
-                )
-            finally:
-                DBSession().commit()
+                    DBSession().commit()
+
+            next_run = tc.ts[key] + interval * 60
+        else:
+            # Outside of the job's time limit; check again in a minute
+            next_run = time.time() + 60
+
+        heapq.heapreplace(schedule, (next_run, i))
+
+    tc.cache_to_file()
+    running = reap(running)
 
-    time.sleep(60)
+    # While jobs are running, wake up regularly to record their results
+    max_delay = 5 if running else 60
+    delay = schedule[0][0] - time.time() if schedule else max_delay
+    time.sleep(min(max(delay, 0), max_delay))
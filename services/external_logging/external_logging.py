@@ -1,16 +1,18 @@
 #!/usr/bin/env python
 
-import logging
+import re
 import socket
-from logging.handlers import SysLogHandler
+import time
 
 from baselayer.app.env import load_env
 from baselayer.log import make_log
-from baselayer.tools.watch_logs import basedir, log_watcher, tail_f
+from baselayer.tools.watch_logs import basedir, follow_logs
 
 env, cfg = load_env()
 log = make_log("external_logging")
 
+_PAPERTRAIL_HOST_RE = re.compile(r"papertrailapp\.com")
+
 
 def is_int(x):
     try:
@@ -21,33 +23,44 @@ def is_int(x):
         return True
 
 
+# Checks on each service's config, as (failure predicate, message) pairs,
+# built once at import; messages may refer to the configured {port}
+CONFIG_CHECKS = {
+    "papertrail": (
+        (
+            lambda c: "url" not in c,
+            "Warning: missing URL for papertrail logging.",
+        ),
+        (
+            lambda c: "port" not in c,
+            "Warning: missing port for papertrail logging.",
+        ),
+        (
+            lambda c: _PAPERTRAIL_HOST_RE.search(c.get("url") or "") is None,
+            "Warning: incorrect URL for papertrail logging.",
+        ),
+        (
+            lambda c: not is_int(c.get("port")),
+            "Warning: bad port [{port}] for papertrail logging. Should be an integer.",
+        ),
+    ),
+}
+
+
 def check_config(config, service):
     if not config.get("enabled", True):
         log(f"Logging service {service} disabled")
         return False
 
-    conditions = [(False, f"Unknown logging service: {service}")]
-
-    if service == "papertrail":
-        conditions = [
-            ("url" not in config, "Warning: missing URL for papertrail logging."),
-            ("port" not in config, "Warning: missing port for papertrail logging."),
-            (
-                config.get("url", "").find("papertrailapp.com") == -1,
-                "Warning: incorrect URL for papertrail logging.",
-            ),
-            (
-                not is_int(config["port"]),
-                f"Warning: bad port [{config['port']}] for papertrail logging. Should be an integer.",
-            ),
-        ]
-
-    for cond, msg in conditions:
-        if cond:
-            log(msg)
+    messages = [
+        msg.format(port=config.get("port"))
+        for check, msg in CONFIG_CHECKS.get(service, ())
+        if check(config)
+    ]
+    if messages:
+        log("\n".join(messages))
 
-    valid = not any(check for (check, msg) in conditions)
-    return valid
+    return not messages
 
 
 def external_logging_services():
@@ -58,66 +71,95 @@ def external_logging_services():
     """
     service_configs = cfg.get("external_logging", [])
 
-    enabled_services = list(
+    enabled_services = [
         service
         for service in service_configs
         if check_config(service_configs[service], service)
-    )
-
-    for service in enabled_services:
-        log(f"Enabling external logging to {service}.")
+    ]
 
-    if not enabled_services:
+    if enabled_services:
+        log(f"Enabling external logging to {', '.join(enabled_services)}.")
+    else:
         log("No external logging services configured")
 
     return enabled_services
 
 
+class SyslogStreamer:
+    """Send lines as INFO records to a remote syslog server, over UDP.
+
+    Produces the same records as a `logging.handlers.SysLogHandler`
+    formatted with `%(asctime)s <hostname> <title>: %(message)s`, but
+    without building and formatting a `logging.LogRecord` per line.
+
+    """
+
+    # Facility "user", priority "info"
+    PRIORITY = b"<14>"
+
+    def __init__(self, host, port, title):
+        # Resolve the address once, rather than on every send
+        family, _, _, _, self.address = socket.getaddrinfo(
+            host, port, type=socket.SOCK_DGRAM
+        )[0]
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.prefix = f" {socket.gethostname()} {title}: ".encode()
+
+        # Timestamps have a resolution of one second
+        self._second = None
+        self._header = b""
+
+    def info(self, message):
+        now = int(time.time())
+        if now != self._second:
+            self._second = now
+            timestamp = time.strftime("%b %d %H:%M:%S", time.localtime(now))
+            self._header = self.PRIORITY + timestamp.encode() + self.prefix
+
+        try:
+            self.socket.sendto(
+                self._header + message.encode("utf-8") + b"\x00", self.address
+            )
+        except OSError as e:
+            log(f"Could not send log record to {self.address}: {e}")
+
+
 def get_papertrail_stream_logger():
-    class ContextFilter(logging.Filter):
-        hostname = socket.gethostname()
-
-        def filter(self, record):
-            record.hostname = ContextFilter.hostname
-            return True
-
-    syslog = SysLogHandler(
-        address=(
-            cfg["external_logging.papertrail.url"],
-            cfg["external_logging.papertrail.port"],
-        )
+    return SyslogStreamer(
+        cfg["external_logging.papertrail.url"],
+        int(cfg["external_logging.papertrail.port"]),
+        title=cfg["app"].get("title", basedir.split("/")[-1]),
     )
-    syslog.addFilter(ContextFilter())
-    title = cfg["app"].get("title", basedir.split("/")[-1])
-    format = f"%(asctime)s %(hostname)s {title}: %(message)s"
-    formatter = logging.Formatter(format, datefmt="%b %d %H:%M:%S")
-    syslog.setFormatter(formatter)
-    logger = logging.getLogger()
-    logger.addHandler(syslog)
-    logger.setLevel(logging.INFO)
-    return logger
 
 
 enabled_services = external_logging_services()
 printers = []
 
 if "papertrail" in enabled_services:
-    # logging set up: see
+    # Papertrail accepts syslog records; see
     # `https://documentation.solarwinds.com/en/Success_Center/papertrail/Content/kb/configuration/configuring-centralized-logging-from-python-apps.htm`
 
     stream_logger = get_papertrail_stream_logger()
+    excluded = cfg["external_logging.papertrail.excluded_log_files"]
 
-    def papertrail_printer(logfile, **kwargs):
-        excluded = cfg["external_logging.papertrail.excluded_log_files"]
+    def papertrail_printer(logfile, lines):
         if logfile in excluded:
             return
-        else:
+
+        if not lines:
+            # Newly discovered log file
             log(f"Streaming {logfile} to papertrail")
             stream_logger.info(f"-> {logfile}")
-            for line in tail_f(logfile):
-                stream_logger.info(line)
+
+        for line in lines:
+            stream_logger.info(line)
 
     printers.append(papertrail_printer)
 
 
-log_watcher(printers)
+# All logs are followed from this one thread, rather than a thread per
+# log file, so printers need not be thread-safe
+if printers:
+    for logfile, lines in follow_logs():
+        for printer in printers:
+            printer(logfile, lines)
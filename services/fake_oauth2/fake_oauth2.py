@@ -1,7 +1,14 @@
+import asyncio
+import itertools
+import json
 import uuid
 
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 import tornado.web
+import uvloop
 from tornado.httputil import url_concat
 from tornado.web import RequestHandler
 
@@ -20,21 +27,39 @@ class FakeGoogleOAuth2AuthHandler(RequestHandler):
         )
 
 
+# Fake tokens are handed out in rotation from a pool of pre-serialized
+# responses, rather than generated for every request
+TOKEN_RESPONSES = itertools.cycle(
+    [
+        json.dumps(
+            {"access_token": str(uuid.uuid4()), "expires_in": "never-expires"}
+        ).encode("utf-8")
+        for _ in range(64)
+    ]
+)
+
+
 class FakeGoogleOAuth2TokenHandler(RequestHandler):
     def post(self):
-        self.get_argument("code") == "fake-authorization-code"
-
-        fake_token = str(uuid.uuid4())
-        self.write({"access_token": fake_token, "expires_in": "never-expires"})
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.write(next(TOKEN_RESPONSES))
 
 
 env, cfg = load_env()
 
+# Bind before forking, so that all workers accept on the same socket;
+# the event loop must only be created after forking
+sockets = tornado.netutil.bind_sockets(cfg["ports.fake_oauth"], reuse_port=True)
+tornado.process.fork_processes(cfg["server.processes"])
+
+asyncio.set_event_loop(uvloop.new_event_loop())
+
 handlers = [
     ("/fakeoauth2/auth", FakeGoogleOAuth2AuthHandler),
     ("/fakeoauth2/token", FakeGoogleOAuth2TokenHandler),
 ]
 app = tornado.web.Application(handlers)
-app.listen(cfg["ports.fake_oauth"])
+server = tornado.httpserver.HTTPServer(app)
+server.add_sockets(sockets)
 
 tornado.ioloop.IOLoop.current().start()
@@ -1,5 +1,7 @@
 # http://zguide.zeromq.org/page:all#The-Dynamic-Discovery-Problem
 
+import os
+
 import zmq
 
 from baselayer.app.env import load_env
@@ -12,12 +14,34 @@ log = make_log("message_proxy")
 IN = cfg["ports.websocket_path_in"]
 OUT = cfg["ports.websocket_path_out"]
 
-context = zmq.Context()
+# Number of messages queued per socket before the proxy stops accepting
+# (PULL) or starts dropping (PUB) messages
+HWM = 100_000
+
+# Kernel socket buffer size; larger buffers mean fewer send / receive
+# system calls per message under load
+BUFFER_SIZE = 4 * 1024 * 1024
+
+context = zmq.Context(io_threads=max(2, (os.cpu_count() or 1) // 2))
+
+
+def configure(socket, address):
+    socket.setsockopt(zmq.SNDBUF, BUFFER_SIZE)
+    socket.setsockopt(zmq.RCVBUF, BUFFER_SIZE)
+    if address.startswith("tcp://"):
+        socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
+
 
+# Socket options only apply to connections made after they are set,
+# so they are set before binding
 feed_in = context.socket(zmq.PULL)
+feed_in.setsockopt(zmq.RCVHWM, HWM)
+configure(feed_in, IN)
 feed_in.bind(IN)
 
 feed_out = context.socket(zmq.PUB)
+feed_out.setsockopt(zmq.SNDHWM, HWM)
+configure(feed_out, OUT)
 feed_out.bind(OUT)
 
 log(f"Forwarding messages between {IN} and {OUT}")
@@ -1,13 +1,19 @@
+import asyncio
+import functools
+import importlib.util
+import json
 import os
-import shutil
-import subprocess
-import time
+import shlex
+import sys
 
 import tornado.ioloop
 import tornado.web
+import uvloop
 
 from baselayer.app.env import load_env
+from baselayer.app.models import init_db
 from baselayer.log import make_log
+from baselayer.tools.cache import timeout_cache
 
 env, cfg = load_env()
 log = make_log("migration_manager")
@@ -15,41 +21,26 @@ log = make_log("migration_manager")
 
 conf_files = env.config
 conf_flags = ["-x", f'config={":".join(conf_files)}'] if conf_files else []
+alembic_cmd = [sys.executable, "-m", "alembic", *conf_flags]
 
+# Options of the alembic version table; env.py may pass these on to
+# `context.configure`, so they are read from alembic.ini as well
+VERSION_TABLE_OPTIONS = ("version_table", "version_table_schema")
 
-class timeout_cache:
-    def __init__(self, timeout):
-        self.timeout = timeout
-        self.lastrun = 0
-        self.cache = None
-        self.func = None
 
-    def __call__(self, f):
-        self.func = f
-        return self.wrapped
-
-    def wrapped(self, *args, **kwargs):
-        tic = self.lastrun
-        toc = time.time()
-        if (toc - tic) > self.timeout or self.cache is None:
-            self.lastrun = toc
-            self.cache = self.func(*args, **kwargs)
-
-        return self.cache
-
-
-def _alembic(*options):
+async def _alembic(*options, stdout=asyncio.subprocess.PIPE):
     path_env = os.environ.copy()
     path_env["PYTHONPATH"] = "."
 
-    p = subprocess.Popen(
-        ["alembic"] + conf_flags + list(options),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+    p = await asyncio.create_subprocess_exec(
+        *alembic_cmd,
+        *options,
+        stdout=stdout,
+        stderr=asyncio.subprocess.PIPE,
         env=path_env,
     )
 
-    output, error = p.communicate()
+    output, error = await p.communicate()
     return p, output, error
 
 
@@ -58,24 +49,64 @@ def migrations_exist():
         log("No migrations present; continuing")
         return False
 
-    if shutil.which("alembic") is None:
-        log("`alembic` executable not found; continuing")
+    if importlib.util.find_spec("alembic") is None:
+        log("`alembic` package not found; continuing")
         return False
 
     return True
 
 
-def migrate():
-    path_env = os.environ.copy()
-    path_env["PYTHONPATH"] = "."
+@functools.lru_cache
+def _alembic_config():
+    from alembic.config import Config
+
+    return Config("alembic.ini")
+
+
+@functools.lru_cache(maxsize=1)
+def _script_directory(versions_mtime):
+    """Load the migration scripts, once per modification of `versions`."""
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(_alembic_config())
+
+
+@functools.lru_cache
+def _context_options():
+    """Version table options set in alembic.ini, if any."""
+    config = _alembic_config()
+    return {
+        option: config.get_main_option(option)
+        for option in VERSION_TABLE_OPTIONS
+        if config.get_main_option(option)
+    }
+
+
+@functools.lru_cache
+def _engine():
+    return init_db(**cfg["database"], engine_args={"pool_size": 1})
 
-    cmd = ["alembic"] + conf_flags + ["upgrade", "head"]
-    log(f'Attempting migration: {" ".join(cmd)}')
-    p = subprocess.Popen(cmd, stderr=subprocess.PIPE, env=path_env)
 
-    output, error = p.communicate()
-    for line in error.decode("utf-8").split("\n"):
-        log(line)
+def _revisions():
+    """Return the revisions the database is at, and the head revisions."""
+    from alembic.runtime.migration import MigrationContext
+
+    script = _script_directory(os.stat("./alembic/versions").st_mtime)
+    with _engine().connect() as conn:
+        context = MigrationContext.configure(conn, opts=_context_options())
+        current = context.get_current_heads()
+
+    return current, script.get_heads()
+
+
+async def migrate():
+    log(f"Attempting migration: {shlex.join([*alembic_cmd, 'upgrade', 'head'])}")
+    p, output, error = await _alembic("upgrade", "head", stdout=None)
+
+    # One call for all of alembic's output; each line is still prefixed
+    error = error.decode("utf-8").strip()
+    if error:
+        log(error)
 
     if p.returncode != 0:
         log("Migration failed")
@@ -84,25 +115,26 @@ def migrate():
 
 
 @timeout_cache(timeout=10)
-def migration_status():
+async def migration_status():
     if not migrations_exist():
         # No migrations present, continue as usual
         return True
 
-    p, output, error = _alembic("current", "--verbose")
-
-    if p.returncode != 0:
-        log("Alembic returned an error; aborting")
-        log(output.decode("utf-8"))
+    # Query alembic in-process, rather than starting `alembic current`,
+    # but off the IOLoop, so that it keeps serving requests
+    try:
+        current, heads = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, _revisions
+        )
+    except Exception as e:
+        log(f"Alembic returned an error; aborting: {e}")
         return False
 
-    status = output.decode("utf-8").strip().split("\n")
-    status = [line for line in status if line.startswith("Rev: ")]
-    if not status:
+    if not current:
         log("Database not stamped: assuming migrations not in use; continuing")
         return True
 
-    if status[0].endswith("(head)"):
+    if set(current) <= set(heads):
         log("Database is up to date")
         return True
 
@@ -110,12 +142,18 @@ def migration_status():
     return False
 
 
+# The only two possible responses, serialized once
+MIGRATED = {
+    status: json.dumps({"migrated": status}).encode("utf-8") for status in (True, False)
+}
+
+
 class MainHandler(tornado.web.RequestHandler):
     def set_default_headers(self):
         self.set_header("Content-Type", "application/json")
 
-    def get(self):
-        self.write({"migrated": migration_status()})
+    async def get(self):
+        self.write(MIGRATED[await migration_status()])
 
 
 def make_app():
@@ -126,11 +164,17 @@ def make_app():
     )
 
 
+async def migrate_if_needed():
+    if migrations_exist() and not await migration_status():
+        # Attempt migration on startup
+        await migrate()
+
+
 if __name__ == "__main__":
+    asyncio.set_event_loop(uvloop.new_event_loop())
+
     try:
-        if migrations_exist() and not migration_status():
-            # Attempt migration on startup
-            migrate()
+        tornado.ioloop.IOLoop.current().run_sync(migrate_if_needed)
     except Exception as e:
         log(f"Uncaught exception: {e}")
 
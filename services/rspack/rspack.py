@@ -1,4 +1,4 @@
-import subprocess
+import os
 import sys
 
 from baselayer.app.env import load_env, parser
@@ -11,17 +11,13 @@ env, cfg = load_env()
 log = make_log("service/rspack")
 
 
-def run(cmd):
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    for line in proc.stdout:
-        log(f"{line.decode().strip()}")
-    return proc
-
-
 if env.debug:
     log("Debug mode detected, launching rspack monitor")
-    p = run(["npx", "rspack", "--watch"])
-    sys.exit(p.returncode)
+    sys.stdout.flush()
+
+    # Replace this process with rspack, which then writes straight to the
+    # service log, instead of relaying its output from here
+    os.execvp("npx", ["npx", "rspack", "--watch"])
 else:
     log("Production mode; not building JavaScript bundle")
     log("Use `make bundle` to produce it from scratch")
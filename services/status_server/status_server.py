@@ -1,31 +1,40 @@
+import asyncio
+import json
+
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 import tornado.web
+import uvloop
 
 from baselayer.app.env import load_env
 
 env, cfg = load_env()
 
+# The responses only depend on the config, so they are built once
+STATUS_BODY = (
+    f"<h2>{cfg['app.title']} is being provisioned</h2>"
+    "<p>Sysadmins can run <code>make monitor</code> on the server to see how that is progressing."
+    "<p>System logs are in <code>./log/app_*.log</code></p>"
+).encode("utf-8")
+
+API_BODY = json.dumps({"status": "error", "message": "System provisioning"}).encode(
+    "utf-8"
+)
+
 
 class MainHandler(tornado.web.RequestHandler):
     def get(self):
         self.set_status(503)
-        self.write(f"<h2>{cfg['app.title']} is being provisioned</h2>")
-        self.write(
-            "<p>Sysadmins can run <code>make monitor</code> on the server to see how that is progressing."
-        )
-        self.write("<p>System logs are in <code>./log/app_*.log</code></p>")
+        self.write(STATUS_BODY)
 
 
 class MainAPIHandler(tornado.web.RequestHandler):
     def get(self, args):
         self.set_header("Content-Type", "application/json")
         self.set_status(503)
-        self.write(
-            {
-                "status": "error",
-                "message": "System provisioning",
-            }
-        )
+        self.write(API_BODY)
 
 
 def make_app():
@@ -38,6 +47,13 @@ def make_app():
 
 
 if __name__ == "__main__":
-    app = make_app()
-    app.listen(cfg["ports.status"])
+    # Bind before forking, so that all workers accept on the same socket;
+    # the event loop must only be created after forking
+    sockets = tornado.netutil.bind_sockets(cfg["ports.status"], reuse_port=True)
+    tornado.process.fork_processes(cfg["server.processes"])
+
+    asyncio.set_event_loop(uvloop.new_event_loop())
+
+    server = tornado.httpserver.HTTPServer(make_app())
+    server.add_sockets(sockets)
     tornado.ioloop.IOLoop.current().start()
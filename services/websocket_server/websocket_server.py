@@ -18,6 +18,11 @@ ctx = zmq.Context()
 
 log = make_log("websocket_server")
 
+# Authentication messages never change, so they are serialized once
+AUTH_REQUEST = json.dumps({"actionType": "AUTH REQUEST"}).encode("utf-8")
+AUTH_OK = json.dumps({"actionType": "AUTH OK"}).encode("utf-8")
+AUTH_FAILED = json.dumps({"actionType": "AUTH FAILED"}).encode("utf-8")
+
 
 class WebSocket(websocket.WebSocketHandler):
     """This is a single Tornado websocket server.  It can handle multiple
@@ -50,9 +55,25 @@ class WebSocket(websocket.WebSocketHandler):
 
     """
 
-    sockets = collections.defaultdict(set)
+    # Each user's websockets; a list, since most users have only one
+    sockets = collections.defaultdict(list)
+    # All authenticated sockets, regardless of user, kept up to date
+    # alongside `sockets` so that broadcasts need not flatten it
+    _all_sockets = set()
     _zmq_stream = None
 
+    # Unsubscriptions not yet applied to the ZMQ stream, as a count per
+    # user: -1 if pending, 0 if cancelled by a resubscription
+    _pending_subscriptions = collections.Counter()
+    # Delay, in seconds, over which unsubscriptions are collected
+    SUBSCRIPTION_DELAY = 0.05
+
+    # Sent as a text frame; the frontend ignores it
+    HEARTBEAT = b"<3"
+
+    # Maximum number of messages forwarded per wakeup of the ZMQ stream
+    MAX_BATCH = 64
+
     def __init__(self, *args, **kwargs):
         websocket.WebSocketHandler.__init__(self, *args, **kwargs)
 
@@ -73,11 +94,38 @@ class WebSocket(websocket.WebSocketHandler):
 
     @classmethod
     def subscribe(cls, user_id):
-        cls._zmq_stream.socket.setsockopt(zmq.SUBSCRIBE, user_id.encode("utf-8"))
+        if cls._pending_subscriptions[user_id] < 0:
+            # Cancel the pending unsubscription; the stream is still
+            # subscribed to this user
+            cls._pending_subscriptions[user_id] += 1
+        else:
+            # Applied right away, so that no messages sent after
+            # authentication are lost
+            cls._zmq_stream.socket.setsockopt(zmq.SUBSCRIBE, user_id.encode("utf-8"))
 
     @classmethod
     def unsubscribe(cls, user_id):
-        cls._zmq_stream.socket.setsockopt(zmq.UNSUBSCRIBE, user_id.encode("utf-8"))
+        """Queue an unsubscription, to be applied shortly.
+
+        When many websockets disconnect and reconnect at once, a user's
+        unsubscription is cancelled by the resubscription, and the
+        stream's subscriptions are left untouched.
+
+        """
+        if not cls._pending_subscriptions:
+            ioloop.IOLoop.current().call_later(
+                cls.SUBSCRIPTION_DELAY, cls._apply_unsubscriptions
+            )
+        cls._pending_subscriptions[user_id] -= 1
+
+    @classmethod
+    def _apply_unsubscriptions(cls):
+        socket = cls._zmq_stream.socket
+        for user_id, change in cls._pending_subscriptions.items():
+            if change < 0:
+                socket.setsockopt(zmq.UNSUBSCRIBE, user_id.encode("utf-8"))
+
+        cls._pending_subscriptions.clear()
 
     def check_origin(self, origin):
         return True
@@ -86,17 +134,19 @@ class WebSocket(websocket.WebSocketHandler):
         self.request_auth()
 
     def on_close(self):
-        sockets = WebSocket.sockets
+        WebSocket._all_sockets.discard(self)
 
-        if self.user_id is not None:
+        user_sockets = WebSocket.sockets.get(self.user_id)
+        if user_sockets is not None:
             try:
-                sockets[self.user_id].remove(self)
-            except KeyError:
+                user_sockets.remove(self)
+            except ValueError:
                 pass
 
             # If we are the last of the user's websockets, since we're leaving
             # we unsubscribe to the message feed
-            if len(sockets[self.user_id]) == 0:
+            if not user_sockets:
+                del WebSocket.sockets[self.user_id]
                 WebSocket.unsubscribe(self.user_id)
 
     def on_message(self, auth_token):
@@ -109,7 +159,7 @@ class WebSocket(websocket.WebSocketHandler):
 
     def request_auth(self):
         self.auth_failures += 1
-        self.send_json(actionType="AUTH REQUEST")
+        self.write_message(AUTH_REQUEST)
 
     def send_json(self, **kwargs):
         self.write_message(json.dumps(kwargs))
@@ -124,45 +174,71 @@ class WebSocket(websocket.WebSocketHandler):
             self.user_id = user_id
             self.authenticated = True
             self.auth_failures = 0
-            self.send_json(actionType="AUTH OK")
+            self.write_message(AUTH_OK)
 
             # If we are the first websocket connecting on behalf of
             # a given user, subscribe to the feed for that user
-            if len(WebSocket.sockets[user_id]) == 0:
+            user_sockets = WebSocket.sockets[user_id]
+            if not user_sockets:
                 WebSocket.subscribe(user_id)
 
-            WebSocket.sockets[user_id].add(self)
+            if self not in user_sockets:
+                user_sockets.append(self)
+            WebSocket._all_sockets.add(self)
 
         except jwt.DecodeError:
-            self.send_json(actionType="AUTH FAILED")
+            self.write_message(AUTH_FAILED)
         except jwt.ExpiredSignatureError:
-            self.send_json(actionType="AUTH FAILED")
+            self.write_message(AUTH_FAILED)
 
     @classmethod
     def heartbeat(cls):
-        for user_id in cls.sockets:
-            for socket in cls.sockets[user_id]:
-                socket.write_message(b"<3")
+        for socket in cls._all_sockets:
+            socket.write_message(cls.HEARTBEAT)
+
+    @classmethod
+    def forward(cls, data):
+        """Broadcast `data`, and any further messages already queued on the
+        ZeroMQ stream, to the websockets.
+
+        Receiving queued messages here, rather than letting the stream
+        call back once for each of them, saves an IOLoop callback per
+        message when messages arrive in bursts.
+
+        """
+        messages = [data]
+        socket = cls._zmq_stream.socket
+        while len(messages) < cls.MAX_BATCH:
+            try:
+                messages.append(socket.recv_multipart(zmq.NOBLOCK))
+            except zmq.Again:
+                break
+
+        # Forward in order of arrival, so that each websocket still
+        # receives its messages in the order they were sent
+        for message in messages:
+            cls.broadcast(message)
 
     # http://mrjoes.github.io/2013/06/21/python-realtime.html
     @classmethod
     def broadcast(cls, data):
-        user_id, payload = (d.decode("utf-8") for d in data)
+        # The payload is already UTF-8 encoded JSON, as sent by the app;
+        # it is forwarded as is, so it is not decoded and re-encoded once
+        # per recipient
+        user_id, payload = data
+        user_id = user_id.decode("utf-8")
 
         if user_id == "*":
-            log("Forwarding message to all users")
+            log(f"Forwarding message to all users ({len(cls._all_sockets)} sockets)")
 
-            all_sockets = [
-                socket for socket_list in cls.sockets.values() for socket in socket_list
-            ]
-
-            for socket in all_sockets:
+            for socket in cls._all_sockets:
                 socket.write_message(payload)
 
         else:
-            for socket in cls.sockets[user_id]:
-                log(f"Forwarding message to user {user_id}")
+            user_sockets = cls.sockets.get(user_id, ())
+            log(f"Forwarding message to user {user_id} ({len(user_sockets)} sockets)")
 
+            for socket in user_sockets:
                 socket.write_message(payload)
 
 
@@ -181,7 +257,7 @@ if __name__ == "__main__":
     log(f"Broadcasting {LOCAL_OUTPUT} to all websockets")
     stream = zmqstream.ZMQStream(sub)
     WebSocket.install_stream(stream)
-    stream.on_recv(WebSocket.broadcast)
+    stream.on_recv(WebSocket.forward)
 
     server = web.Application(
         [
@@ -190,11 +266,9 @@ if __name__ == "__main__":
     )
     server.listen(PORT)
 
-    io_loop = ioloop.IOLoop.current()
-
     # We send a heartbeat every 45 seconds to make sure that nginx
     # proxy does not time out and close the connection
     ioloop.PeriodicCallback(WebSocket.heartbeat, 45000).start()
 
     log(f"Listening for incoming websocket connections on port {PORT}")
-    ioloop.IOLoop.instance().start()
+    ioloop.IOLoop.current().start()
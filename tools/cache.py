@@ -0,0 +1,72 @@
+import asyncio
+import inspect
+import time
+
+
+class timeout_cache:
+    """Cache the result of a function for `timeout` seconds.
+
+    Results are cached separately for each combination of arguments.
+
+    Coroutine functions may also be decorated.  Concurrent calls with the
+    same arguments then share a single evaluation of the function, rather
+    than each starting their own while the cache is cold.
+
+    Usage::
+
+        @timeout_cache(timeout=10)
+        def expensive_check():
+            ...
+
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.cache = {}
+        self.inflight = {}
+        self.func = None
+
+    def __call__(self, f):
+        self.func = f
+        if inspect.iscoroutinefunction(f):
+            return self.wrapped_async
+        return self.wrapped
+
+    @staticmethod
+    def _key(args, kwargs):
+        return args, tuple(sorted(kwargs.items()))
+
+    def _cached(self, key):
+        entry = self.cache.get(key)
+        if entry is None or (time.time() - entry[0]) > self.timeout:
+            return None
+        return entry
+
+    def wrapped(self, *args, **kwargs):
+        key = self._key(args, kwargs)
+        entry = self._cached(key)
+        if entry is None:
+            entry = self.cache[key] = (time.time(), self.func(*args, **kwargs))
+
+        return entry[1]
+
+    async def wrapped_async(self, *args, **kwargs):
+        key = self._key(args, kwargs)
+        entry = self._cached(key)
+        if entry is not None:
+            return entry[1]
+
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.func(*args, **kwargs))
+            future.add_done_callback(lambda f: self._store(key, f))
+            self.inflight[key] = future
+
+        # Shielded, so that one cancelled caller does not cancel the
+        # evaluation for everyone else waiting on it
+        return await asyncio.shield(future)
+
+    def _store(self, key, future):
+        del self.inflight[key]
+        if not future.cancelled() and future.exception() is None:
+            self.cache[key] = (time.time(), future.result())
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import concurrent.futures
 import os
 import subprocess
 import sys
@@ -38,11 +39,17 @@ print("Checking system dependencies:")
 
 fail = []
 
+# The version commands are independent, and mostly wait on process
+# startup, so they are all started at once; results are reported in order
+pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(deps))
+outputs = {dep: pool.submit(output, cmd) for dep, (cmd, _, _) in deps.items()}
+pool.shutdown(wait=False)
+
 for dep, (cmd, get_version, min_version) in deps.items():
     try:
         query = f"{dep} >= {min_version}"
         with status(query):
-            success, out = output(cmd)
+            success, out = outputs[dep].result()
             try:
                 version = get_version(out.decode("utf-8").strip())
                 print(f"[{version.rjust(8)}]".rjust(40 - len(query)), end="")
@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 import argparse
-import subprocess
+import concurrent.futures
+import contextlib
+import shlex
 import sys
 import textwrap
 
+import psycopg2
+from psycopg2 import sql
 from status import status
 
 from baselayer.app.env import load_env
@@ -31,101 +35,156 @@ host = cfg["database.host"]
 port = cfg["database.port"]
 password = cfg["database.password"]
 
-psql_cmd = "psql"
-flags = f"-U {user}"
+connection_flags = ["--no-password"]
+if host:
+    connection_flags += ["-h", host]
+if port:
+    connection_flags += ["-p", str(port)]
 
-if password:
-    psql_cmd = f'PGPASSWORD="{password}" {psql_cmd}'
-flags += " --no-password"
+flags = ["-U", user] + connection_flags
 
-if host:
-    flags += f" -h {host}"
 
-if port:
-    flags += f" -p {port}"
+def psql_shell_cmd(*args):
+    """A psql shell command, for users to run by hand."""
+    cmd = shlex.join(["psql", *args])
+    return f'PGPASSWORD="{password}" {cmd}' if password else cmd
 
-admin_flags = flags.replace(f"-U {user}", "-U postgres")
 
-test_cmd = f"{psql_cmd} {flags} -c 'SELECT 0;' "
+def connect(dbname, user):
+    """Connect to `dbname` as `user`, committing each statement as it runs."""
+    conn = psycopg2.connect(
+        dbname=dbname,
+        user=user,
+        host=host or None,
+        port=port or None,
+        password=password or None,
+    )
+    conn.autocommit = True
+    return conn
 
 
-def run(cmd):
-    return subprocess.run(cmd, capture_output=True, shell=True)
+def connection_error(database):
+    """Return the error raised when querying `database`, or None if it works."""
+    try:
+        with contextlib.closing(connect(database, user)) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 0;")
+    except psycopg2.Error as e:
+        return e
 
+    return None
 
-def test_db(database):
-    p = run(test_cmd + database)
-    return p.returncode == 0
+
+# Nothing to set up if the databases can already be queried
+if not args.force and all(connection_error(d) is None for d in all_dbs):
+    log("Databases already exist and are reachable; nothing to do")
+    sys.exit(0)
+
+# Users are created and databases dropped over this one connection
+try:
+    admin_conn = connect("postgres", "postgres")
+    admin_error = None
+except psycopg2.Error as e:
+    admin_conn = None
+    admin_error = e
+
+
+def admin_execute(query):
+    if admin_conn is None:
+        raise admin_error
+
+    with admin_conn.cursor() as cursor:
+        cursor.execute(query)
 
 
 log("Initializing databases")
 
 with status(f"Creating user [{user}]"):
-    run(f'{psql_cmd} {admin_flags} -c "CREATE USER {user};"')
+    try:
+        admin_execute(sql.SQL("CREATE USER {};").format(sql.Identifier(user)))
+    except psycopg2.Error:
+        # The user most likely exists already
+        pass
 
 if args.force:
     try:
         for current_db in all_dbs:
             with status(f"Removing database [{current_db}]"):
-                p = run(
-                    f'{psql_cmd} {admin_flags}\
-                          -c "DROP DATABASE {current_db};"'
+                admin_execute(
+                    sql.SQL("DROP DATABASE {};").format(sql.Identifier(current_db))
                 )
-                if p.returncode != 0:
-                    raise RuntimeError()
-    except RuntimeError:
+    except psycopg2.Error as e:
         print(
             "Could not delete database: \n\n"
-            f'{textwrap.indent(p.stderr.decode("utf-8").strip(), prefix="  ")}\n'
+            f'{textwrap.indent(str(e).strip(), prefix="  ")}\n'
         )
         sys.exit(1)
 
-for current_db in all_dbs:
-    with status(f"Creating database [{current_db}]"):
-        # We allow this to fail, because oftentimes because of complicated db setups
-        # users want to create their own databases
 
-        # If database already exists and we can connect to it, there's nothing to do
-        if test_db(current_db):
-            continue
+def create_database(database):
+    """Create `database`, unless it can already be queried.
 
-        p = run(
-            f'{psql_cmd} {admin_flags}\
-                  -c "CREATE DATABASE {current_db} OWNER {user};"'
-        )
-        if p.returncode == 0:
-            run(
-                f'{psql_cmd} {flags}\
-                 -c "GRANT ALL PRIVILEGES ON DATABASE {current_db} TO {user};"\
-                 {current_db}'
-            )
-        else:
+    Returns the error raised while creating the database, if any.  Each
+    call uses its own connections, so that databases can be created
+    concurrently.
+
+    """
+    # If database already exists and we can connect to it, there's nothing to do
+    if connection_error(database) is None:
+        return None
+
+    try:
+        with contextlib.closing(connect("postgres", "postgres")) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("CREATE DATABASE {} OWNER {};").format(
+                        sql.Identifier(database), sql.Identifier(user)
+                    )
+                )
+                cursor.execute(
+                    sql.SQL("GRANT ALL PRIVILEGES ON DATABASE {} TO {};").format(
+                        sql.Identifier(database), sql.Identifier(user)
+                    )
+                )
+    except psycopg2.Error as e:
+        return e
+
+    return None
+
+
+# The databases are independent, so they are set up in parallel;
+# results are reported in order
+with concurrent.futures.ThreadPoolExecutor(max_workers=len(all_dbs)) as pool:
+    errors = pool.map(create_database, all_dbs)
+    for current_db in all_dbs:
+        with status(f"Creating database [{current_db}]"):
+            # We allow this to fail, because oftentimes because of complicated db setups
+            # users want to create their own databases
+            error = next(errors)
+            if error is None:
+                continue
+
+            grant = f"GRANT ALL PRIVILEGES ON DATABASE {current_db} TO {user};"
             print()
             print(f"Warning: could not create db {current_db}")
             print()
-            print(
-                "\n".join(
-                    line
-                    for line in p.stderr.decode("utf-8").split("\n")
-                    if "ERROR" in line
-                )
-            )
+            print(str(error).strip())
             print()
             print("  You should create it manually by invoking `createdb`.")
             print("  Then, execute:")
             print()
-            print(
-                f"    {psql_cmd} {flags}"
-                f' -c "GRANT ALL PRIVILEGES ON DATABASE {current_db} TO {user};"'
-                f" {current_db}"
-            )
+            print(f"    {psql_shell_cmd(*flags, '-c', grant, current_db)}")
             print()
 
+if admin_conn is not None:
+    admin_conn.close()
+
 # We only test the connection to the main database, since
 # the test database may not exist in production
 try:
     with status(f"Testing database connection to [{db}]"):
-        if not test_db(db):
+        error = connection_error(db)
+        if error is not None:
             raise RuntimeError()
 
 except RuntimeError:
@@ -147,13 +206,13 @@ except RuntimeError:
         The postgres client exited with the following error message:
 
         {'-' * 78}
-        {p.stderr.decode('utf-8').strip()}
+        {str(error).strip()}
         {'-' * 78}
 
         Please modify your `pg_hba.conf`, and use the following command to
         check your connection:
 
-          {test_cmd + db}
+          {psql_shell_cmd(*flags, "-c", "SELECT 0;", db)}
         """
         )
     )
@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 
+import concurrent.futures
+import functools
+import hashlib
+import importlib
+import json
 import os
+import re
+import shutil
 import subprocess
 
 import jinja2
@@ -11,32 +18,87 @@ from baselayer.log import make_log
 
 log = make_log("baselayer")
 
+BROTLI_MODULE_RE = re.compile(r"--add-module=\S*brotli")
+
 
 def md5sum(fn):
-    import hashlib
+    # Unchanged files are not hashed again
+    st = os.stat(fn)
+    return _md5sum(fn, st.st_mtime_ns, st.st_size)
+
 
+@functools.lru_cache(maxsize=None)
+def _md5sum(fn, mtime_ns, size):
     with open(fn, "rb") as f:
+        # Python 3.11+ hashes the file without a Python-level read loop
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "md5").hexdigest()
+
         file_hash = hashlib.md5()
-        while chunk := f.read(8192):
+        while chunk := f.read(1024 * 1024):
             file_hash.update(chunk)
     return file_hash.hexdigest()
 
 
+@functools.lru_cache(maxsize=None)
 def version(module):
-    import importlib
-
     m = importlib.import_module(module)
     return getattr(m, "__version__", "")
 
 
+@functools.lru_cache(maxsize=None)
 def hash_filter(string, htype):
-    import hashlib
-
     h = hashlib.new(htype)
     h.update(string.encode("utf-8"))
     return h.hexdigest()
 
 
+# Build information of the nginx binary, cached between runs
+NGINX_CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "baselayer",
+    "nginx_build_info.json",
+)
+
+
+def nginx_build_info():
+    """Return the output of `nginx -V`.
+
+    The output only changes when nginx is reinstalled, so it is cached on
+    disk, keyed by the path, modification time and size of the binary.
+    """
+    path = shutil.which("nginx")
+    if path is None:
+        # As running `nginx -V` would
+        raise FileNotFoundError("nginx executable not found on the PATH")
+
+    st = os.stat(path)
+    key = [path, st.st_mtime_ns, st.st_size]
+    try:
+        with open(NGINX_CACHE_FILE) as f:
+            cached = json.load(f)
+        if cached["key"] == key:
+            return cached["output"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    output = subprocess.check_output(["nginx", "-V"], stderr=subprocess.STDOUT).decode(
+        "utf-8"
+    )
+
+    try:
+        os.makedirs(os.path.dirname(NGINX_CACHE_FILE), exist_ok=True)
+        tmp_file = f"{NGINX_CACHE_FILE}.{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            json.dump({"key": key, "output": output}, f)
+        os.replace(tmp_file, NGINX_CACHE_FILE)
+    except OSError:
+        # The cache is only an optimization
+        pass
+
+    return output
+
+
 def nginx_brotli_installed():
     """Check if the nginx brotli module is installed
 
@@ -55,14 +117,9 @@ def nginx_brotli_installed():
     modules_path = None
 
     try:
-        output = subprocess.check_output(
-            ["nginx", "-V"], stderr=subprocess.STDOUT
-        ).decode("utf-8")
+        output = nginx_build_info()
         # Option 1: installed at compilation: always loaded
-        if (
-            "--add-module" in output
-            and "brotli" in output.split("--add-module")[1].strip()
-        ):
+        if BROTLI_MODULE_RE.search(output):
             installed = True
         # Option 2: installed dynamically at compilation or later: has to be loaded
         else:
@@ -121,21 +178,37 @@ def fill_config_file_values(template_paths):
         }
     }
 
+    cfg["env"] = env
+
+    # One Jinja environment per template directory, shared by all of the
+    # templates in it; templates are rendered once, so never reloaded
+    jenvs = {}
     for template_path in template_paths:
-        with status(template_path):
-            tpath, tfile = os.path.split(template_path)
-            jenv = jinja2.Environment(
+        tpath = os.path.dirname(template_path)
+        if tpath not in jenvs:
+            jenvs[tpath] = jinja2.Environment(
                 loader=jinja2.FileSystemLoader(tpath),
+                auto_reload=False,
             )
-            jenv.filters.update(custom_filters)
-
-            template = jenv.get_template(tfile)
-            cfg["env"] = env
-            rendered = template.render(cfg)
-
-            with open(os.path.splitext(template_path)[0], "w") as f:
-                f.write(rendered)
-                f.write("\n")
+            jenvs[tpath].filters.update(custom_filters)
+
+    def render(template_path):
+        tpath, tfile = os.path.split(template_path)
+        template = jenvs[tpath].get_template(tfile)
+        rendered = template.render(cfg)
+
+        with open(os.path.splitext(template_path)[0], "w") as f:
+            f.write(rendered)
+            f.write("\n")
+
+    # The templates are independent, so they are rendered in parallel;
+    # results are reported in order
+    max_workers = min(len(template_paths), os.cpu_count() or 1) or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(render, template_paths)
+        for template_path in template_paths:
+            with status(template_path):
+                next(results)
 
 
 if __name__ == "__main__":
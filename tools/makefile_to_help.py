@@ -18,9 +18,12 @@ if not sys.argv:
     print("Usage: makefile_to_help.py <MAKEFILE0> <MAKEFILE1> ...")
     sys.exit(0)
 
+# A target followed by a `##` help comment
+TARGET_RE = re.compile(r"^([\w-]+): +##(.*)")
+
 
 def describe_targets(lines):
-    matches = [re.match(r"^([\w-]+): +##(.*)", line) for line in lines]
+    matches = [TARGET_RE.match(line) for line in lines]
     groups = [m.groups(0) for m in matches if m]
     targets = {target: desc for (target, desc) in groups}
 
@@ -2,9 +2,11 @@
 
 import os
 import pathlib
+import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 import time
 from os.path import join as pjoin
 
@@ -94,6 +96,18 @@ if __name__ == "__main__":
     parser.add_argument(
         "--headless", action="store_true", help="Run browser headlessly"
     )
+    parser.add_argument(
+        "--no-images",
+        action="store_true",
+        help="Do not load images in the browser (faster page loads)",
+    )
+    parser.add_argument(
+        "-n",
+        "--workers",
+        default=None,
+        help="Number of pytest-xdist workers (or `auto`); each worker"
+        " drives its own browser. Tests are distributed by file.",
+    )
     args = parser.parse_args()
 
     # Initialize the test database connection
@@ -123,9 +137,22 @@ if __name__ == "__main__":
     if args.headless:
         os.environ["BASELAYER_TEST_HEADLESS"] = "1"
 
+    if args.no_images:
+        os.environ["BASELAYER_TEST_DISABLE_IMAGES"] = "1"
+
+    if args.workers is not None:
+        workers = f"-n {args.workers} --dist loadfile"
+    else:
+        workers = ""
+
     log("Clearing test database...")
     clear_tables()
 
+    # Test browsers share their login session, but only within this run,
+    # since user ids change whenever the test database is cleared
+    session_dir = tempfile.mkdtemp(prefix="baselayer-test-")
+    os.environ["BASELAYER_TEST_COOKIES_FILE"] = pjoin(session_dir, "cookies.json")
+
     web_client = subprocess.Popen(
         ["make", "run_testing"], cwd=basedir, preexec_fn=os.setsid
     )
@@ -140,7 +167,7 @@ if __name__ == "__main__":
 
         log(f"Launching pytest on {test_spec}...\n")
         p = subprocess.run(
-            f"python -m pytest -s -v {xml} {test_spec} " f"{RAND_ARGS}",
+            f"python -m pytest -s -v {xml} {workers} {test_spec} " f"{RAND_ARGS}",
             shell=True,
         )
         if p.returncode != 0:
@@ -157,6 +184,7 @@ if __name__ == "__main__":
     finally:
         log("Terminating supervisord...")
         os.killpg(os.getpgid(web_client.pid), signal.SIGTERM)
+        shutil.rmtree(session_dir, ignore_errors=True)
 
     code, msg = exit_status
     log(msg)
@@ -11,30 +11,123 @@ from baselayer.log import colorize
 basedir = pjoin(os.path.dirname(__file__), "..")
 logdir = "../log"
 
+# Size of reads from followed log files
+READ_SIZE = 64 * 1024
 
-def tail_f(filename, interval=1.0):
-    f = None
 
-    while not f:
+class LogReader:
+    """Read lines appended to a file, as with `tail -f`.
+
+    Reading starts at the current end of the file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._f = open(filename, "rb", buffering=READ_SIZE)
+        self._f.seek(0, os.SEEK_END)
+
+        # Lines are split as bytes, so that multi-byte characters
+        # straddling two reads are decoded correctly
+        self._partial = b""
+
+    def read_lines(self):
+        """Return the complete lines appended since the last read.
+
+        Each call reads everything appended to the file (up to
+        `READ_SIZE` bytes) at once, so that busy logs are consumed in
+        batches rather than line by line.  A partially written last line
+        is held back until it is completed.
+
+        Returns
+        -------
+        lines : list of str
+            Lines, without newlines.
+        """
+        data = self._f.read1(READ_SIZE)
+        if not data:
+            return []
+
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+def tail_f_batches(filename, interval=1.0):
+    """Follow a file, as with `tail -f`.
+
+    Yields
+    ------
+    lines : list of str
+        The complete lines appended since the last read; see
+        `LogReader.read_lines`.
+    """
+    reader = None
+
+    while reader is None:
         try:
-            f = open(filename)
-            break
+            reader = LogReader(filename)
         except OSError:
             time.sleep(1)
 
-    # Find the size of the file and move to the end
-    st_results = os.stat(filename)
-    st_size = st_results[6]
-    f.seek(st_size)
+    while True:
+        lines = reader.read_lines()
+        if lines:
+            yield lines
+        else:
+            time.sleep(interval)
+
+
+def tail_f(filename, interval=1.0):
+    """Follow a file, as with `tail -f`, yielding one line at a time."""
+    for lines in tail_f_batches(filename, interval=interval):
+        yield from lines
+
+
+def follow_logs(pattern="log/*.log", interval=1.0, discovery_interval=60):
+    """Follow all log files matching `pattern`, from a single thread.
+
+    Log files that appear later are picked up as well.
+
+    Parameters
+    ----------
+    pattern : str
+        Glob pattern of the log files to follow.
+    interval : float
+        Seconds to wait when none of the logs have new lines.
+    discovery_interval : float
+        Seconds between searches for new log files.
+
+    Yields
+    ------
+    logfile : str
+        Path of the log file.
+    lines : list of str
+        Complete lines appended to `logfile`.  A newly discovered log file
+        is first reported with an empty list.
+
+    """
+    readers = {}
+    last_discovery = 0
 
     while True:
-        where = f.tell()
-        line = f.readline()
-        if not line:
+        if time.time() - last_discovery >= discovery_interval:
+            last_discovery = time.time()
+            for logfile in sorted(set(glob.glob(pattern)) - readers.keys()):
+                try:
+                    readers[logfile] = LogReader(logfile)
+                except OSError:
+                    continue
+                yield logfile, []
+
+        idle = True
+        for logfile, reader in readers.items():
+            lines = reader.read_lines()
+            if lines:
+                idle = False
+                yield logfile, lines
+
+        if idle:
             time.sleep(interval)
-            f.seek(where)
-        else:
-            yield line.rstrip("\n")
 
 
 def print_log(filename, color="default", stream=None):